@@ -5,11 +5,13 @@ import random
 BCM = "BCM"
 IN = "IN"
 OUT = "OUT"
+BOTH = "BOTH"
 
 class MockState:
     def __init__(self):
-        self.echo_start = 0
-        self.is_echo_active = False
+        self.triggered = False
+        self.pulse_start_ts = 0
+        self.pulse_end_ts = 0
         self.distance = random.uniform(20, 30)  # Random distance between 20-30cm
 
 _state = MockState()
@@ -22,28 +24,30 @@ def setup(pin, mode):
 
 def output(pin, value):
     if value:  # Trigger pulse started
-        _state.echo_start = time.time()
-        _state.is_echo_active = True
         # Generate new random distance for next reading
         _state.distance = random.uniform(20, 30)
+        _state.triggered = True
+    elif _state.triggered:  # Trigger pulse ended; the echo follows
+        _state.triggered = False
+        # Precompute the echo pulse window
+        # Speed of sound = 343 m/s = 34300 cm/s
+        # Time = distance * 2 / speed (multiply by 2 for round trip)
+        _state.pulse_start_ts = time.time() + 0.00001  # Initial delay
+        _state.pulse_end_ts = _state.pulse_start_ts + (_state.distance * 2) / 34300
 
 def input(pin):
-    if not _state.is_echo_active:
-        return 0
-    
-    # Calculate time delay based on distance
-    # Speed of sound = 343 m/s = 34300 cm/s
-    # Time = distance * 2 / speed (multiply by 2 for round trip)
-    delay = (_state.distance * 2) / 34300
-    
-    elapsed = time.time() - _state.echo_start
-    if elapsed < 0.00001:  # Initial delay
-        return 0
-    elif elapsed < delay:  # Echo pulse
-        return 1
-    else:
-        _state.is_echo_active = False
-        return 0
+    t = time.time()
+    return 1 if _state.pulse_start_ts <= t < _state.pulse_end_ts else 0
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    pass
+
+def remove_event_detect(pin):
+    pass
+
+def get_distance():
+    """Mock only: distance simulated for the last trigger pulse"""
+    return _state.distance
 
 def cleanup():
     pass
\ No newline at end of file
@@ -1,6 +1,8 @@
 import logging
 import time
 import asyncio
+import gc
+from concurrent.futures import ThreadPoolExecutor
 from sensor_script import LiquidLevelSensor
 from voice_script import VoiceCommandRecognizer
 from powerautomate_script import PowerAutomateConnector
@@ -9,43 +11,53 @@ from websocket_server import manager
 from datetime import datetime
 import os
 
+log = logging.getLogger(__name__)
+
 class SystemIntegrator:
     def __init__(self, sensor, voice_recognizer, power_automate, websocket_url=None):
         self.sensor = sensor
         self.voice_recognizer = voice_recognizer
         self.power_automate = power_automate
         self.websocket_url = websocket_url
+        # Sensor reads block on GPIO; run them on one reused worker thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor")
+        # Sensor and voice run as independent loops until cleanup() sets _stop
+        self._stop = asyncio.Event()
+        self._tasks = set()  # Strong references to running tasks
         # Make potion_mixer optional
         self.potion_mixer = None
         try:
             from potion_mixer import PotionMixer
             self.potion_mixer = PotionMixer(sensor, voice_recognizer, power_automate)
         except ImportError:
-            logging.warning("PotionMixer module not available - some features will be disabled")
+            log.warning("PotionMixer module not available - some features will be disabled")
         
     async def process_sensor_reading(self):
         """Process and send sensor reading"""
         try:
-            reading = self.sensor.get_filtered_reading()
+            loop = asyncio.get_running_loop()
+            reading = await loop.run_in_executor(self._executor, self.sensor.get_filtered_reading)
             if reading is not None:
+                timestamp = datetime.now().isoformat()
                 # Send to Power Automate
-                self.power_automate.send_sensor_data(reading)
-                # Broadcast via WebSocket
-                await manager.broadcast({
+                await self.power_automate.send_sensor_data(reading, timestamp=timestamp)
+                # Queue for WebSocket clients without waiting on their sockets
+                manager.publish({
                     'type': 'sensor_reading',
                     'value': reading,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': timestamp
                 })
                 return True
             return False
         except Exception as e:
-            logging.error(f"Error processing sensor reading: {str(e)}")
+            log.error("Error processing sensor reading: %s", e)
             return False
 
     async def process_voice_command(self):
         """Process voice commands for potion brewing"""
         try:
-            command = self.voice_recognizer.listen_for_command()
+            # Listening records from the microphone; keep it off the event loop
+            command = await asyncio.to_thread(self.voice_recognizer.listen_for_command)
             if not command:
                 return False
                 
@@ -53,12 +65,12 @@ class SystemIntegrator:
                 return await self.potion_mixer.start_new_potion()
                 
             if 'add_ingredient' in command:
-                # Look for ingredient type in command
-                ingredient_type = None
-                for ing_type, keywords in self.voice_recognizer.command_keywords['ingredient_type'].items():
-                    if any(keyword in command for keyword in keywords):
-                        ingredient_type = ing_type
-                        break
+                # The recognizer reports a named ingredient as ('ingredient_type', name)
+                ingredient_type = next(
+                    (item[1] for item in command
+                     if isinstance(item, tuple) and item[0] == 'ingredient_type'),
+                    None
+                )
                         
                 if ingredient_type:
                     return await self.potion_mixer.add_ingredient(ingredient_type)
@@ -69,37 +81,82 @@ class SystemIntegrator:
             return False
             
         except Exception as e:
-            logging.error(f"Error processing voice command: {str(e)}")
+            log.error("Error processing voice command: %s", e)
             return False
 
-    async def run_monitoring_cycle(self, interval=5):
-        """Run a full monitoring cycle"""
+    async def run_monitoring_cycle(self):
+        """Run a single sensor and voice cycle concurrently"""
         results = {
             'sensor_success': False,
             'voice_success': False
         }
         
         try:
-            results['sensor_success'] = await self.process_sensor_reading()
-            await asyncio.sleep(interval)  # Wait between readings
-            results['voice_success'] = await self.process_voice_command()
+            results['sensor_success'], results['voice_success'] = await asyncio.gather(
+                self.process_sensor_reading(),
+                self.process_voice_command()
+            )
         except Exception as e:
-            logging.error(f"Error in monitoring cycle: {str(e)}")
+            log.error("Error in monitoring cycle: %s", e)
             
         return results
 
+    async def start(self, interval=5):
+        """Start the sensor and voice loops as independent tasks"""
+        self._stop.clear()
+        self._spawn(self._sensor_loop(interval))
+        self._spawn(self._voice_loop())
+
+    def _spawn(self, coro):
+        """Create a task and hold a reference to it until it finishes"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run(self, interval=5):
+        """Run the sensor and voice loops until cleanup() is called"""
+        await self.start(interval)
+        await self._stop.wait()
+
+    async def _sensor_loop(self, interval):
+        while not self._stop.is_set():
+            await self.process_sensor_reading()
+            await self._pause(interval)
+
+    async def _voice_loop(self):
+        while not self._stop.is_set():
+            await self.process_voice_command()
+            # Listening already paces this loop; just avoid spinning on failures
+            await self._pause(0.1)
+
+    async def _pause(self, interval):
+        """Sleep for interval, waking early when stopping"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
     async def cleanup(self):
         """Cleanup resources"""
-        # Implementation of cleanup method
-        pass
+        self._stop.set()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.power_automate.close()
+        self._executor.shutdown(wait=False)
 
 if __name__ == "__main__":
     # Initialize components
     sensor = LiquidLevelSensor()
     
+    # Transcribe with the OpenAI API unless a local backend is selected
+    whisper_backend = os.getenv('WHISPER_BACKEND', 'openai')
+
     # Get API key from environment variable
     api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
+    if not api_key and whisper_backend == 'openai':
         raise ValueError("OPENAI_API_KEY environment variable not set")
         
     # Get Power Automate endpoints from environment variables
@@ -109,7 +166,7 @@ if __name__ == "__main__":
     if not sensor_endpoint or not command_endpoint:
         raise ValueError("Power Automate endpoints not configured in environment variables")
     
-    voice_recognizer = VoiceCommandRecognizer(api_key=api_key)
+    voice_recognizer = VoiceCommandRecognizer(api_key=api_key, backend=whisper_backend)
     power_automate = PowerAutomateConnector(
         sensor_endpoint=sensor_endpoint,
         command_endpoint=command_endpoint
@@ -126,12 +183,12 @@ if __name__ == "__main__":
         websocket_url
     )
     
+    gc.freeze()  # Long-lived setup objects stay out of later collections
+
     async def main():
         try:
-            while True:
-                results = await integrator.run_monitoring_cycle()
-                logging.info(f"Monitoring cycle results: {results}")
-        except KeyboardInterrupt:
+            await integrator.run()
+        finally:
             await integrator.cleanup()
     
     # Run the async main loop
@@ -1,115 +1,246 @@
+import asyncio
+import aiohttp
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
 import time
+import random
 from datetime import datetime
 import logging
+import weakref
+
+log = logging.getLogger(__name__)
+
+# HTTP sessions shared by every integration and connector on the same event
+# loop, so the sensor, command and webhook endpoints reuse one socket pool and
+# DNS cache. Keyed by loop because a session only works on the loop it was made on.
+_sessions = weakref.WeakKeyDictionary()
+
+def _backoff_delay(retry_count):
+    """Exponential backoff with jitter so instances don't retry in lockstep"""
+    return min(30.0, 1.0 * (2 ** retry_count) * (1 + random.uniform(0, 0.5)))
+
+def _is_retryable(status):
+    """429 (rate limited) and 5xx may succeed on a resend; anything else won't change"""
+    return status == 429 or 500 <= status < 600
+
+def _get_session():
+    """Return the running event loop's shared HTTP session, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    # No await between the check and the assignment, so this needs no lock
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(
+            headers={'Content-Type': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=3),
+            connector=aiohttp.TCPConnector(
+                limit=8,
+                limit_per_host=4,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+        )
+    return session
+
+def _encode(data):
+    """JSON-encode a payload, accepting NumPy scalars and arrays; None if it can't be encoded"""
+    try:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    except TypeError as e:
+        log.error("Could not encode payload: %s", e)
+        return None
+
+def _iso(timestamp):
+    """Format a time.time_ns() timestamp as local ISO-8601; strings pass through"""
+    if isinstance(timestamp, int):
+        seconds, ns = divmod(timestamp, 1_000_000_000)
+        return datetime.fromtimestamp(seconds).replace(microsecond=ns // 1000).isoformat()
+    return timestamp
+
+async def close_session():
+    """Close the running event loop's shared HTTP session and its pooled connections"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
 
 class PowerAutomateIntegration:
     def __init__(self, webhook_url):
         self.webhook_url = webhook_url
-        self.required_fields = {'timestamp', 'reading', 'status'}
+        self.required_fields = frozenset({'timestamp', 'reading', 'status'})
+        # Keep connections alive between sends; retries are done by send_reading itself
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive'
+        })
 
     def send_reading(self, reading_data, max_retries=3):
         """Send sensor reading to Power Automate flow"""
         if not self._validate_reading(reading_data):
-            logging.error("Invalid reading data format")
+            log.error("Invalid reading data format")
             return False
 
+        payload = _encode(reading_data)  # Encoded once, reused by every retry
+        if payload is None:
+            return False
         retry_count = 0
         while retry_count < max_retries:
+            if retry_count:
+                time.sleep(_backoff_delay(retry_count))
             try:
-                response = requests.post(
-                    self.webhook_url,
-                    data=json.dumps(reading_data),
-                    headers={'Content-Type': 'application/json'}
-                )
+                response = self.session.post(self.webhook_url, data=payload)
                 if response.status_code == 202:
                     return True
-                    
-                logging.warning(f"Request failed with status {response.status_code}")
+
+                if not _is_retryable(response.status_code):
+                    log.warning("Non-retryable status %s", response.status_code)
+                    return False
+                log.warning("Request failed with status %s", response.status_code)
                 retry_count += 1
-                time.sleep(1)  # Wait before retry
-                
-            except Exception as e:
-                logging.error(f"Error sending reading: {str(e)}")
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                log.error("Error sending reading: %s", e)
                 retry_count += 1
-                time.sleep(1)
-                
+            except requests.exceptions.RequestException as e:
+                log.error("Error sending reading: %s", e)
+                return False
+
+        return False
+
+    async def send_reading_async(self, reading_data, max_retries=3):
+        """Send sensor reading to Power Automate flow without blocking the event loop"""
+        if not self._validate_reading(reading_data):
+            log.error("Invalid reading data format")
+            return False
+
+        payload = _encode(reading_data)  # Encoded once, reused by every retry
+        if payload is None:
+            return False
+        retry_count = 0
+        while retry_count < max_retries:
+            if retry_count:
+                await asyncio.sleep(_backoff_delay(retry_count))
+            try:
+                async with _get_session().post(self.webhook_url, data=payload) as response:
+                    status = response.status
+                if status == 202:
+                    return True
+
+                if not _is_retryable(status):
+                    log.warning("Non-retryable status %s", status)
+                    return False
+                log.warning("Request failed with status %s", status)
+                retry_count += 1
+
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                log.error("Error sending reading: %s", e)
+                retry_count += 1
+            except aiohttp.ClientError as e:
+                log.error("Error sending reading: %s", e)
+                return False
+
         return False
 
     def _validate_reading(self, reading_data):
         """Validate reading data format"""
-        return all(field in reading_data for field in self.required_fields)
+        return self.required_fields <= reading_data.keys()
 
     def process_batch_readings(self, readings):
-        """Process multiple readings"""
-        results = []
-        for reading in readings:
-            result = self.send_reading(reading)
-            results.append(result)
-        return results
+        """Process multiple readings (blocking wrapper for synchronous callers)"""
+        async def run():
+            try:
+                return await self.process_batch_readings_async(readings)
+            finally:
+                # asyncio.run's loop is private to this call, so its session is ours to close
+                await close_session()
+
+        return asyncio.run(run())
+
+    async def process_batch_readings_async(self, readings, concurrency=8):
+        """Process multiple readings concurrently"""
+        # One timestamp for the batch, used for readings that don't carry their own
+        timestamp = datetime.now().isoformat()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send_one(reading):
+            if 'timestamp' not in reading:
+                reading = {**reading, 'timestamp': timestamp}
+            async with semaphore:
+                return await self.send_reading_async(reading)
+
+        return list(await asyncio.gather(*(send_one(reading) for reading in readings)))
+
+    def close(self):
+        """Close this integration's blocking HTTP session; the shared async one is left to its loop's owner"""
+        self.session.close()
 
 class PowerAutomateConnector:
     def __init__(self, sensor_endpoint, command_endpoint):
         self.sensor_endpoint = sensor_endpoint
         self.command_endpoint = command_endpoint
-        self.session = requests.Session()  # For connection pooling
-        self.headers = {'Content-Type': 'application/json'}
 
-    def send_sensor_data(self, level):
+    async def send_sensor_data(self, level, timestamp=None):
         """Handle sensor data transmission"""
-        payload = json.dumps({'liquid_level': level})
-        
+        payload = {'liquid_level': level}
+        if timestamp is not None:
+            payload['timestamp'] = timestamp
+
+        data = _encode(payload)
+        if data is None:
+            return False
         try:
-            response = self.session.post(
-                self.sensor_endpoint,
-                headers=self.headers,
-                data=payload,
-                timeout=3
-            )
-            response.raise_for_status()
+            async with _get_session().post(self.sensor_endpoint, data=data) as response:
+                response.raise_for_status()
             return True
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Sensor data POST failed: {str(e)}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error("Sensor data POST failed: %s", e)
             return False
 
-    def send_command(self, command):
+    async def send_command(self, command):
         """Handle command transmission"""
-        payload = json.dumps({'voice_command': command})
-        
+        payload = {'voice_command': command}
+
+        data = _encode(payload)
+        if data is None:
+            return False
         try:
-            response = self.session.post(
-                self.command_endpoint,
-                headers=self.headers,
-                data=payload,
-                timeout=3
-            )
-            response.raise_for_status()
+            async with _get_session().post(self.command_endpoint, data=data) as response:
+                response.raise_for_status()
             return True
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Command POST failed: {str(e)}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error("Command POST failed: %s", e)
             return False
 
     async def send_potion_data(self, potion_data):
         """Handle potion data transmission"""
-        payload = json.dumps({
+        payload = {
             'potion_data': {
-                'start_time': potion_data['start_time'],
-                'ingredients': potion_data['ingredients'],
+                # The flow expects ISO strings; potions record time.time_ns() internally
+                'start_time': _iso(potion_data['start_time']),
+                'ingredients': [
+                    {**ingredient, 'timestamp': _iso(ingredient['timestamp'])}
+                    if 'timestamp' in ingredient else ingredient
+                    for ingredient in potion_data['ingredients']
+                ],
                 'total_volume': potion_data['total_volume'],
                 'completion_time': datetime.now().isoformat()
             }
-        })
-        
+        }
+
+        data = _encode(payload)
+        if data is None:
+            return False
         try:
-            response = await self.session.post(
-                self.command_endpoint,
-                headers=self.headers,
-                data=payload,
-                timeout=3
-            )
-            response.raise_for_status()
+            async with _get_session().post(self.command_endpoint, data=data) as response:
+                response.raise_for_status()
             return True
-        except Exception as e:
-            logging.error(f"Potion data POST failed: {str(e)}")
-            return False
\ No newline at end of file
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error("Potion data POST failed: %s", e)
+            return False
+
+    async def close(self):
+        """Close the running loop's shared HTTP session and its pooled connections"""
+        await close_session()
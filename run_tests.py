@@ -8,7 +8,9 @@ def run_tests():
         'test_sensor.py',
         'test_voice.py',
         'test_powerautomate.py',
-        'test_integration.py'
+        'test_integration.py',
+        'test_websocket_server.py',
+        'test_websocket_stream.py'
     ]
     
     # Basic pytest arguments with async support
@@ -5,25 +5,46 @@ except ImportError:
     import Mock.GPIO as GPIO  # For development environments
     USING_MOCK = True
 import time
+import threading
 import logging
-from collections import deque
 import json
+import orjson
+import numpy as np
+import os
 from datetime import datetime
 
-# Configure logging to be less noisy during tests
-logging.getLogger().setLevel(logging.WARNING)
+log = logging.getLogger(__name__)
 
 class LiquidLevelSensor:
     def __init__(self, trigger_pin=23, echo_pin=24, log_file="sensor_readings.json"):
         self.trigger = trigger_pin
         self.echo = echo_pin
         self.sample_window = 5  # Moving average window
-        self.readings = deque(maxlen=self.sample_window)
-        self.log_file = log_file
+        # Ring buffer with a running sum keeps the moving average O(1) per sample
+        self._buf = np.zeros(self.sample_window)
+        self._idx = 0
+        self._count = 0
+        self._sum = 0.0
+        # Readings are appended as JSON Lines; see compact_log() for the array format
+        self.log_file = os.path.splitext(log_file)[0] + '.jsonl'
+        # Buffered, flushed every 100 records or once a second, whichever comes first
+        self._log_fh = open(self.log_file, 'ab', buffering=1 << 16)
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
         
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.trigger, GPIO.OUT)
         GPIO.setup(self.echo, GPIO.IN)
+        # Time the echo pulse from pin edge interrupts instead of polling
+        self._rise_ts = None
+        self._fall_ts = None
+        self._fall_event = threading.Event()
+        try:
+            GPIO.add_event_detect(self.echo, GPIO.BOTH, callback=self._on_edge)
+            self._edge_detect = True
+        except (AttributeError, RuntimeError) as e:
+            log.warning("Edge detection unavailable, polling echo pin: %s", e)
+            self._edge_detect = False
         self._calibrate_sensor()
 
     def _calibrate_sensor(self):
@@ -31,77 +52,123 @@ class LiquidLevelSensor:
         GPIO.output(self.trigger, False)
         time.sleep(0.5)
 
+    def _on_edge(self, channel):
+        """GPIO callback recording echo rise/fall times"""
+        now = time.monotonic()
+        # Classify by order after the trigger: callback latency can outlast a short
+        # echo pulse, so re-reading the pin here may already see it low
+        if self._rise_ts is None:
+            self._rise_ts = now
+        elif not self._fall_event.is_set():
+            self._fall_ts = now
+            self._fall_event.set()
+
     def _measure_distance(self):
         """Ultrasonic measurement core logic"""
+        self._rise_ts = None  # The next edge is this measurement's rise
+        self._fall_event.clear()
         GPIO.output(self.trigger, True)
         time.sleep(0.00001)
         GPIO.output(self.trigger, False)
 
-        start_time = time.time()
-        pulse_start = start_time
-        pulse_end = start_time
+        if USING_MOCK:
+            # The mock already knows the simulated distance; skip the echo busy-wait
+            return round(GPIO.get_distance(), 2)
+
+        if self._edge_detect:
+            if not self._fall_event.wait(timeout=0.1):
+                return None
+            pulse_duration = self._fall_ts - self._rise_ts
+        else:
+            pulse_duration = self._poll_echo()
+        distance = pulse_duration * 17150  # Convert to cm
         
-        timeout = time.time() + 0.1  # Reduced timeout for testing
+        if not (2 <= distance <= 400):  # Valid range check
+            return None
+            
+        return round(distance, 2)
+
+    def _poll_echo(self):
+        """Busy-wait on the echo pin and return the pulse duration"""
+        # Bind lookups to locals; these loops run thousands of times per measurement
+        _now = time.monotonic
+        _input = GPIO.input
+        echo = self.echo
+
+        pulse_start = pulse_end = _now()
+        timeout = pulse_start + 0.1  # Reduced timeout for testing
         
         # Wait for pulse start
-        while GPIO.input(self.echo) == 0:
-            pulse_start = time.time()
+        while _input(echo) == 0:
+            pulse_start = _now()
             if pulse_start > timeout:
                 break
         
         # Wait for pulse end
-        while GPIO.input(self.echo) == 1:
-            pulse_end = time.time()
+        while _input(echo) == 1:
+            pulse_end = _now()
             if pulse_end > timeout:
                 break
 
-        pulse_duration = pulse_end - pulse_start
-        distance = pulse_duration * 17150  # Convert to cm
-        
-        if not (2 <= distance <= 400):  # Valid range check
-            if USING_MOCK:  # Check if we're using mock GPIO
-                return 25.0  # Return a safe default for testing
-            return None
-            
-        return round(distance, 2)
+        return pulse_end - pulse_start
 
     def get_filtered_reading(self):
         """Get filtered reading and store it"""
         try:
             raw_distance = self._measure_distance()
             if raw_distance is not None:
-                self.readings.append(raw_distance)
-                filtered_reading = round(sum(self.readings)/len(self.readings), 2)
+                old = float(self._buf[self._idx])
+                self._sum += raw_distance - old
+                self._buf[self._idx] = raw_distance
+                self._idx = (self._idx + 1) % self.sample_window
+                self._count = min(self._count + 1, self.sample_window)
+                if self._idx == 0:
+                    # Resync once per lap so float error in the running sum can't accumulate
+                    self._sum = float(self._buf.sum())
+                filtered_reading = round(self._sum / self._count, 2)
                 self._store_reading(filtered_reading)
                 return filtered_reading
             return None
         except Exception as e:
-            logging.error(f"Sensor error: {str(e)}")
+            log.error("Sensor error: %s", e)
             return None
             
     def _store_reading(self, reading):
-        """Store reading with timestamp"""
+        """Append reading with timestamp to the log"""
         data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(),  # orjson writes naive datetimes in ISO format
             'reading': reading
         }
-        
+
         try:
-            # Load existing readings
-            try:
-                with open(self.log_file, 'r') as f:
-                    readings = json.load(f)
-            except FileNotFoundError:
-                readings = []
-                
-            # Append new reading
-            readings.append(data)
-            
-            # Save back to file
-            with open(self.log_file, 'w') as f:
-                json.dump(readings, f, indent=2)
+            self._log_fh.write(orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE))
+            self._unflushed += 1
+            if self._unflushed >= 100 or time.monotonic() - self._last_flush >= 1.0:
+                self.flush()
         except Exception as e:
-            logging.error(f"Error storing reading: {str(e)}")
+            log.error("Error storing reading: %s", e)
+
+    def flush(self):
+        """Write buffered readings through to the log file"""
+        self._log_fh.flush()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def read_all(self):
+        """Return every reading logged so far, including buffered ones"""
+        self.flush()
+        with open(self.log_file, 'rb') as f:
+            return [orjson.loads(line) for line in f if line.strip()]
 
     def cleanup(self):
-        GPIO.cleanup()
\ No newline at end of file
+        self._log_fh.close()
+        GPIO.cleanup()
+
+def compact_log(jsonl_file, json_file):
+    """Convert a JSON Lines reading log into a single JSON array file"""
+    with open(jsonl_file, 'r') as f:
+        readings = [json.loads(line) for line in f if line.strip()]
+
+    with open(json_file, 'w') as f:
+        json.dump(readings, f)
+    return len(readings)
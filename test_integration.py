@@ -1,6 +1,7 @@
 import pytest
 import asyncio
-from unittest.mock import patch, MagicMock
+import numpy as np
+from unittest.mock import patch, MagicMock, ANY
 from integration_script import SystemIntegrator
 from sensor_script import LiquidLevelSensor
 from voice_script import VoiceCommandRecognizer
@@ -60,7 +61,7 @@ class TestSystemIntegration:
 
         result = await self.integrator.process_sensor_reading()
         assert result is True
-        self.mock_connector.send_sensor_data.assert_called_once_with(self.test_level)
+        self.mock_connector.send_sensor_data.assert_called_once_with(self.test_level, timestamp=ANY)
 
     async def test_process_sensor_reading_failure(self):
         """Test handling of sensor reading failures"""
@@ -79,6 +80,30 @@ class TestSystemIntegration:
         self.mock_voice.listen_for_command.assert_called_once()
         self.mock_potion_mixer.start_new_potion.assert_called_once()
 
+    async def test_process_voice_command_add_ingredient(self):
+        """Test ingredient type is resolved from the parsed command"""
+        self.mock_voice.listen_for_command.return_value = [
+            'add_ingredient', ('ingredient_type', 'crystal')
+        ]
+
+        result = await self.integrator.process_voice_command()
+        assert result is True
+        self.mock_potion_mixer.add_ingredient.assert_called_once_with('crystal')
+
+    async def test_process_voice_command_with_recognizer(self):
+        """Test a transcript parsed by the real recognizer reaches the potion mixer"""
+        recognizer = VoiceCommandRecognizer(api_key="test")
+        self.integrator.voice_recognizer = recognizer
+
+        audio_data = np.full(16000, 0.1, dtype=np.float32)  # One second, loud enough to send
+
+        with patch.object(recognizer, '_record_audio', return_value=audio_data), \
+                patch.object(recognizer, '_transcribe_audio', return_value="I added dragon blood"):
+            result = await self.integrator.process_voice_command()
+
+        assert result is True
+        self.mock_potion_mixer.add_ingredient.assert_called_once_with('dragon_blood')
+
     async def test_process_voice_command_failure(self):
         """Test handling of voice command failures"""
         self.mock_voice.listen_for_command.return_value = None
@@ -99,6 +124,23 @@ class TestSystemIntegration:
         assert results['sensor_success'] is True
         assert results['voice_success'] is True
 
+    async def test_start_runs_independent_loops(self):
+        """Test sensor and voice loops run on their own until cleanup"""
+        self.mock_sensor.get_filtered_reading.return_value = self.test_level
+        self.mock_voice.listen_for_command.return_value = None
+
+        await self.integrator.start(interval=0.01)
+        assert len(self.integrator._tasks) == 2
+        await asyncio.sleep(0.1)
+        await self.integrator.cleanup()
+        assert not self.integrator._tasks
+
+        sensor_calls = self.mock_sensor.get_filtered_reading.call_count
+        assert sensor_calls > 1
+        self.mock_voice.listen_for_command.assert_called()
+        await asyncio.sleep(0.05)
+        assert self.mock_sensor.get_filtered_reading.call_count == sensor_calls
+
     async def test_error_handling(self):
         """Test error handling in monitoring cycle"""
         self.mock_sensor.get_filtered_reading.side_effect = Exception("Sensor error")
@@ -112,7 +154,7 @@ class TestSystemIntegration:
 
     async def test_logging(self):
         """Test logging functionality"""
-        with patch('logging.error') as mock_logging:
+        with patch('integration_script.log.error') as mock_logging:
             self.mock_sensor.get_filtered_reading.side_effect = Exception("Test error")
             await self.integrator.process_sensor_reading()
             
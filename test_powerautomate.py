@@ -1,9 +1,13 @@
 import unittest
+import asyncio
 from unittest.mock import patch, MagicMock
 import json
 import os
 from datetime import datetime
-from powerautomate_script import PowerAutomateIntegration
+import aiohttp
+import numpy as np
+import powerautomate_script
+from powerautomate_script import PowerAutomateIntegration, PowerAutomateConnector
 
 class TestPowerAutomateIntegration(unittest.TestCase):
     def setUp(self):
@@ -18,7 +22,7 @@ class TestPowerAutomateIntegration(unittest.TestCase):
             'status': 'normal'
         }
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_send_reading(self, mock_post):
         """Test sending sensor reading to Power Automate"""
         # Setup mock response
@@ -37,7 +41,7 @@ class TestPowerAutomateIntegration(unittest.TestCase):
         self.assertEqual(sent_data['reading'], 25.5)
         self.assertEqual(sent_data['status'], 'normal')
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_send_reading_failure(self, mock_post):
         """Test handling of failed API calls"""
         # Setup mock response for failure
@@ -48,6 +52,8 @@ class TestPowerAutomateIntegration(unittest.TestCase):
         # Test failed send
         result = self.power_automate.send_reading(self.test_reading)
         self.assertFalse(result)
+        # Client errors are not retried
+        mock_post.assert_called_once()
 
     def test_validate_reading(self):
         """Test reading validation"""
@@ -70,14 +76,69 @@ class TestPowerAutomateIntegration(unittest.TestCase):
             }
         ]
 
-        with patch.object(self.power_automate, 'send_reading') as mock_send:
+        with patch.object(self.power_automate, 'send_reading_async') as mock_send:
             mock_send.return_value = True
             results = self.power_automate.process_batch_readings(batch_readings)
             self.assertEqual(len(results), 2)
             self.assertTrue(all(results))
 
-    @patch('requests.post')
-    def test_retry_mechanism(self, mock_post):
+    def test_process_batch_fills_missing_timestamps(self):
+        """Test readings without a timestamp share one batch timestamp"""
+        batch_readings = [
+            {'reading': 25.5, 'status': 'normal'},
+            {'reading': 26.0, 'status': 'warning'},
+            self.test_reading
+        ]
+
+        with patch.object(self.power_automate, 'send_reading_async') as mock_send:
+            mock_send.return_value = True
+            self.power_automate.process_batch_readings(batch_readings)
+
+        sent = [c[0][0] for c in mock_send.call_args_list]
+        self.assertIn('timestamp', sent[0])
+        self.assertEqual(sent[0]['timestamp'], sent[1]['timestamp'])
+        self.assertEqual(sent[2]['timestamp'], self.test_reading['timestamp'])
+        self.assertNotIn('timestamp', batch_readings[0])
+
+    def test_process_batch_readings_concurrent(self):
+        """Test batch readings are sent concurrently up to the limit"""
+        in_flight = 0
+        peak = 0
+
+        async def fake_send(reading):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return True
+
+        batch_readings = [self.test_reading] * 20
+        with patch.object(self.power_automate, 'send_reading_async', side_effect=fake_send):
+            results = asyncio.run(
+                self.power_automate.process_batch_readings_async(batch_readings, concurrency=4)
+            )
+        self.assertEqual(results, [True] * 20)
+        self.assertEqual(peak, 4)
+
+    def test_send_reading_async_retry(self):
+        """Test async send retries transient failures"""
+        session = MagicMock()
+        session.post.return_value.__aenter__.side_effect = [
+            MagicMock(status=503),
+            MagicMock(status=202)
+        ]
+
+        with patch('powerautomate_script._get_session', return_value=session), \
+                patch('asyncio.sleep') as mock_sleep:
+            result = asyncio.run(self.power_automate.send_reading_async(self.test_reading))
+        self.assertTrue(result)
+        self.assertEqual(session.post.call_count, 2)
+        mock_sleep.assert_awaited_once()
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_retry_mechanism(self, mock_post, mock_sleep):
         """Test retry mechanism for failed requests"""
         # Setup mock to fail first, succeed second
         mock_responses = [
@@ -92,6 +153,187 @@ class TestPowerAutomateIntegration(unittest.TestCase):
         )
         self.assertTrue(result)
         self.assertEqual(mock_post.call_count, 2)
+        mock_sleep.assert_called_once()
+        # The payload is encoded once and resent as-is
+        first, second = (c[1]['data'] for c in mock_post.call_args_list)
+        self.assertIs(first, second)
+        self.assertGreaterEqual(mock_sleep.call_args[0][0], 2.0)
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_retry_on_rate_limit_and_server_error(self, mock_post, mock_sleep):
+        """Test 429 and any 5xx are retried while other 4xx are not"""
+        mock_post.side_effect = [
+            MagicMock(status_code=429),
+            MagicMock(status_code=501),
+            MagicMock(status_code=202)
+        ]
+        self.assertTrue(self.power_automate.send_reading(self.test_reading))
+        self.assertEqual(mock_post.call_count, 3)
+
+        mock_post.reset_mock()
+        mock_post.side_effect = None
+        mock_post.return_value = MagicMock(status_code=404)
+        self.assertFalse(self.power_automate.send_reading(self.test_reading))
+        mock_post.assert_called_once()
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_no_retry_on_other_statuses(self, mock_post, mock_sleep):
+        """Test 2xx other than 202 and 3xx fail without resending the reading"""
+        for status in (200, 204, 302):
+            mock_post.reset_mock()
+            mock_post.return_value = MagicMock(status_code=status)
+            self.assertFalse(self.power_automate.send_reading(self.test_reading))
+            mock_post.assert_called_once()
+
+        session = MagicMock()
+        session.post.return_value.__aenter__.return_value = MagicMock(status=200)
+        with patch('powerautomate_script._get_session', return_value=session):
+            result = asyncio.run(self.power_automate.send_reading_async(self.test_reading))
+        self.assertFalse(result)
+        session.post.assert_called_once()
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_retry_backoff_capped(self, mock_post, mock_sleep):
+        """Test backoff delay grows but never exceeds the cap"""
+        mock_post.return_value = MagicMock(status_code=503)
+
+        result = self.power_automate.send_reading(
+            self.test_reading,
+            max_retries=8
+        )
+        self.assertFalse(result)
+        self.assertEqual(mock_post.call_count, 8)
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertTrue(all(d <= 30.0 for d in delays))
+        self.assertEqual(delays[-1], 30.0)
+
+class TestPayloadEncoding(unittest.TestCase):
+    def setUp(self):
+        self.power_automate = PowerAutomateIntegration(webhook_url="https://test-flow/trigger")
+
+    @patch('requests.Session.post')
+    def test_numpy_values_are_encoded(self, mock_post):
+        """Test readings carrying NumPy scalars still post"""
+        mock_post.return_value = MagicMock(status_code=202)
+        reading = {'timestamp': 't', 'reading': np.float64(25.5), 'status': 'normal'}
+
+        self.assertTrue(self.power_automate.send_reading(reading))
+        self.assertEqual(json.loads(mock_post.call_args[1]['data'])['reading'], 25.5)
+
+    def test_unencodable_reading_fails_alone(self):
+        """Test one unencodable reading doesn't abort the batch"""
+        session = MagicMock()
+        session.post.return_value.__aenter__.return_value = MagicMock(status=202)
+        readings = [
+            {'timestamp': 't', 'reading': object(), 'status': 'normal'},
+            {'timestamp': 't', 'reading': 25.5, 'status': 'normal'}
+        ]
+        with patch('powerautomate_script._get_session', return_value=session):
+            results = asyncio.run(self.power_automate.process_batch_readings_async(readings))
+
+        self.assertEqual(results, [False, True])
+        self.assertEqual(session.post.call_count, 1)
+
+class TestSharedSession(unittest.TestCase):
+    def setUp(self):
+        """Set up an event loop standing in for the integrator's long-lived loop"""
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.addCleanup(lambda: self.loop.run_until_complete(powerautomate_script.close_session()))
+
+    def test_session_shared_within_loop(self):
+        """Test connectors on one loop share a session"""
+        async def get_two():
+            return powerautomate_script._get_session(), powerautomate_script._get_session()
+
+        first, second = self.loop.run_until_complete(get_two())
+        self.assertIs(first, second)
+
+    def test_batch_wrapper_leaves_other_loops_session_open(self):
+        """Test the blocking batch wrapper only closes the session of its own loop"""
+        async def get_session():
+            return powerautomate_script._get_session()
+
+        main_session = self.loop.run_until_complete(get_session())
+        batch_sessions = []
+
+        async def fake_send(reading):
+            batch_sessions.append(powerautomate_script._get_session())
+            return True
+
+        integration = PowerAutomateIntegration(webhook_url="https://test-flow/trigger")
+        with patch.object(integration, 'send_reading_async', side_effect=fake_send):
+            self.assertEqual(integration.process_batch_readings([{'reading': 1}]), [True])
+
+        self.assertIsNot(batch_sessions[0], main_session)
+        self.assertTrue(batch_sessions[0].closed)
+        self.assertFalse(main_session.closed)
+        self.assertIs(self.loop.run_until_complete(get_session()), main_session)
+
+class TestPowerAutomateConnector(unittest.TestCase):
+    def setUp(self):
+        """Set up connector with a mocked HTTP session"""
+        self.connector = PowerAutomateConnector(
+            sensor_endpoint="https://test-flow.maker.powerautomate.com/sensor",
+            command_endpoint="https://test-flow.maker.powerautomate.com/command"
+        )
+        self.session = MagicMock()
+        self.response = MagicMock()
+        self.session.post.return_value.__aenter__.return_value = self.response
+        patcher = patch('powerautomate_script._get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.potion = {
+            'start_time': datetime.now().isoformat(),
+            'ingredients': [{'type': 'dragon_blood', 'volume': 1.5}],
+            'total_volume': 1.5
+        }
+
+    def test_send_sensor_data(self):
+        """Test sensor level is posted to the sensor endpoint"""
+        result = asyncio.run(self.connector.send_sensor_data(25.5, timestamp='t'))
+        self.assertTrue(result)
+
+        url = self.session.post.call_args[0][0]
+        sent_data = json.loads(self.session.post.call_args[1]['data'])
+        self.assertEqual(url, self.connector.sensor_endpoint)
+        self.assertEqual(sent_data, {'liquid_level': 25.5, 'timestamp': 't'})
+
+    def test_send_potion_data(self):
+        """Test potion data is awaited and posted to the command endpoint"""
+        result = asyncio.run(self.connector.send_potion_data(self.potion))
+        self.assertTrue(result)
+        self.response.raise_for_status.assert_called_once()
+
+        url = self.session.post.call_args[0][0]
+        sent_data = json.loads(self.session.post.call_args[1]['data'])
+        self.assertEqual(url, self.connector.command_endpoint)
+        self.assertEqual(sent_data['potion_data']['total_volume'], 1.5)
+        self.assertIn('completion_time', sent_data['potion_data'])
+
+    def test_send_potion_data_failure(self):
+        """Test HTTP errors are reported as a failed send"""
+        self.response.raise_for_status.side_effect = aiohttp.ClientError("boom")
+        result = asyncio.run(self.connector.send_potion_data(self.potion))
+        self.assertFalse(result)
+
+    def test_send_potion_data_formats_ns_timestamps(self):
+        """Test time_ns timestamps are sent as ISO strings like completion_time"""
+        start = datetime(2024, 5, 1, 12, 30, 15, 250000)
+        start_ns = int(start.timestamp()) * 1_000_000_000 + 250_000_000
+        self.potion['start_time'] = start_ns
+        self.potion['ingredients'][0]['timestamp'] = start_ns
+
+        asyncio.run(self.connector.send_potion_data(self.potion))
+
+        sent_data = json.loads(self.session.post.call_args[1]['data'])['potion_data']
+        self.assertEqual(sent_data['start_time'], start.isoformat())
+        self.assertEqual(sent_data['ingredients'][0]['timestamp'], start.isoformat())
+        self.assertEqual(self.potion['ingredients'][0]['timestamp'], start_ns)
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
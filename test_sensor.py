@@ -1,5 +1,6 @@
 import unittest
-from sensor_script import LiquidLevelSensor
+from unittest.mock import patch
+from sensor_script import LiquidLevelSensor, compact_log
 import time
 import json
 import os
@@ -12,6 +13,8 @@ class TestLiquidLevelSensor(unittest.TestCase):
     def tearDown(self):
         self.sensor.cleanup()
         # Clean up test file
+        if os.path.exists(self.sensor.log_file):
+            os.remove(self.sensor.log_file)
         if os.path.exists(self.test_log_file):
             os.remove(self.test_log_file)
     
@@ -23,7 +26,7 @@ class TestLiquidLevelSensor(unittest.TestCase):
     
     def test_filtered_reading(self):
         """Test if sensor returns filtered reading"""
-        # Take multiple readings to fill the deque
+        # Take multiple readings to fill the window
         readings = []
         for _ in range(5):
             reading = self.sensor.get_filtered_reading()
@@ -34,7 +37,84 @@ class TestLiquidLevelSensor(unittest.TestCase):
         self.assertTrue(len(readings) > 0, "Should get at least one valid reading")
         self.assertTrue(all(isinstance(r, float) for r in readings))
         self.assertTrue(all(2 < r < 400 for r in readings))
+
+    def test_moving_average(self):
+        """Test filter averages over the last sample_window readings"""
+        raw = [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0]
+        with patch.object(self.sensor, '_measure_distance', side_effect=raw):
+            filtered = [self.sensor.get_filtered_reading() for _ in raw]
+
+        self.assertEqual(filtered[0], 10.0)
+        self.assertEqual(filtered[1], 15.0)
+        self.assertEqual(filtered[4], 30.0)
+        self.assertEqual(filtered[5], 40.0)
+        self.assertEqual(filtered[6], 50.0)
     
+    def test_moving_average_does_not_drift(self):
+        """Test the running sum stays exact over many readings"""
+        raw = [0.1, 1e6, 0.3, 0.7, 0.2] * 200 + [0.1] * 5
+        with patch.object(self.sensor, '_measure_distance', side_effect=raw), \
+                patch.object(self.sensor, '_store_reading'):
+            for _ in raw:
+                self.sensor.get_filtered_reading()
+
+        self.assertEqual(self.sensor._sum, 0.5)
+
+    def test_edge_timed_distance(self):
+        """Test distance is computed from echo edge timestamps"""
+        edge_times = iter([100.0, 100.0 + 25.0 / 17150])
+
+        def output(pin, value):
+            # Echo edges arrive once the trigger pulse ends
+            if not value:
+                self.sensor._on_edge(self.sensor.echo)
+                self.sensor._on_edge(self.sensor.echo)
+
+        with patch('sensor_script.USING_MOCK', False), \
+                patch.object(self.sensor, '_edge_detect', True), \
+                patch('sensor_script.GPIO.output', side_effect=output), \
+                patch('sensor_script.GPIO.input', return_value=0), \
+                patch('sensor_script.time.monotonic', side_effect=lambda: next(edge_times)):
+            # Edges are classified by order, even if the pin already reads low
+            self.assertEqual(self.sensor._measure_distance(), 25.0)
+
+    def test_edge_timeout_ignores_previous_cycle(self):
+        """Test a measurement with only a rising edge times out"""
+        self.sensor._rise_ts = 100.0
+        self.sensor._fall_ts = 100.0 + 25.0 / 17150
+
+        def output(pin, value):
+            if not value:
+                self.sensor._on_edge(self.sensor.echo)
+
+        with patch('sensor_script.USING_MOCK', False), \
+                patch.object(self.sensor, '_edge_detect', True), \
+                patch('sensor_script.GPIO.output', side_effect=output):
+            self.assertIsNone(self.sensor._measure_distance())
+        self.assertGreater(self.sensor._rise_ts, 100.0)
+
+    def test_polled_distance(self):
+        """Test polling fallback times the echo pulse"""
+        # Simulated clock advancing 1 µs per read, so the result can't depend on
+        # how promptly this thread is scheduled
+        now = [0.0]
+        pulse_start, pulse_end = 50e-6, 50e-6 + 25.0 * 2 / 34300
+
+        def monotonic():
+            now[0] += 1e-6
+            return now[0]
+
+        def echo(pin):
+            return 1 if pulse_start <= now[0] < pulse_end else 0
+
+        with patch('sensor_script.USING_MOCK', False), \
+                patch.object(self.sensor, '_edge_detect', False), \
+                patch('sensor_script.time.monotonic', side_effect=monotonic), \
+                patch('sensor_script.GPIO.input', side_effect=echo):
+            distance = self.sensor._measure_distance()
+
+        self.assertAlmostEqual(distance, 25.0, delta=0.1)
+
     def test_reading_storage(self):
         """Test if readings are properly stored"""
         # Get multiple readings
@@ -49,12 +129,38 @@ class TestLiquidLevelSensor(unittest.TestCase):
             attempts += 1
             time.sleep(0.1)
         
-        # Verify file exists and contains readings
-        self.assertTrue(os.path.exists(self.test_log_file))
+        # Verify file exists and contains one JSON record per line
+        self.assertTrue(os.path.exists(self.sensor.log_file))
+        readings = self.sensor.read_all()
+        self.assertEqual(len(readings), valid_readings)
+        self.assertTrue(all('timestamp' in r and 'reading' in r for r in readings))
+
+        with open(self.sensor.log_file, 'r') as f:
+            self.assertEqual([json.loads(line) for line in f], readings)
+
+    def test_log_flushes_periodically(self):
+        """Test readings are buffered and flushed every 100 records"""
+        with patch('sensor_script.time.monotonic', return_value=self.sensor._last_flush):
+            for i in range(99):
+                self.sensor._store_reading(float(i))
+            self.assertEqual(os.path.getsize(self.sensor.log_file), 0)
+
+            self.sensor._store_reading(99.0)
+        with open(self.sensor.log_file, 'r') as f:
+            self.assertEqual(len(f.readlines()), 100)
+
+    def test_compact_log(self):
+        """Test conversion of the JSON Lines log to a JSON array"""
+        for _ in range(3):
+            self.sensor.get_filtered_reading()
+        self.sensor.flush()
+
+        count = compact_log(self.sensor.log_file, self.test_log_file)
         with open(self.test_log_file, 'r') as f:
             readings = json.load(f)
-            self.assertGreater(len(readings), 0)
-            self.assertTrue(all('timestamp' in r and 'reading' in r for r in readings))
+        self.assertEqual(len(readings), count)
+        self.assertEqual(count, 3)
+        self.assertTrue(all('timestamp' in r and 'reading' in r for r in readings))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
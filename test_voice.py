@@ -1,121 +1,25 @@
-# Pro-Code Potions: Advanced audio processing
-# Thieving Bastards: OpenAI Whisper API integration
-
-from openai import OpenAI
-import logging
-import sounddevice as sd
 import numpy as np
-from scipy.io.wavfile import write
+import io
+import wave
 import tempfile
-import time
-from dotenv import load_dotenv
 import os
-import openai
+import sys
+import gc
+import subprocess
 import unittest
 from unittest.mock import patch, MagicMock
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Configure OpenAI with API key from environment variable
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-class VoiceCommandRecognizer:
-    def __init__(self, api_key, model="whisper-1"):
-        self.client = OpenAI(api_key=api_key)
-        self.model = model
-        self.command_keywords = {
-            'start': ['begin', 'start', 'initiate'],
-            'production': ['production', 'process', 'manufacturing'],
-            'consume': ['consume', 'use', 'utilize'],
-            'finish': ['complete', 'finish', 'finalize']
-        }
-        self.sample_rate = 16000  # Whisper recommended sample rate
-        self.channels = 1
-        self.silence_threshold = 0.03  # Adjust based on microphone sensitivity
-
-    def _record_audio(self, duration=5):
-        """Capture audio from microphone with voice activity detection"""
-        print("Listening...")
-        audio_data = []
-        
-        def callback(indata, frames, time, status):
-            if status:
-                print(f"Error in audio stream: {status}")
-            if np.max(np.abs(indata)) > self.silence_threshold:
-                audio_data.extend(indata.copy())
-        
-        with sd.InputStream(samplerate=self.sample_rate,
-                            channels=self.channels,
-                            callback=callback):
-            start_time = time.time()
-            while len(audio_data) < self.sample_rate * duration:
-                if time.time() - start_time > duration:
-                    break
-                sd.sleep(100)
-        
-        if len(audio_data) == 0:
-            print("No audio detected.")
-            return None
-            
-        return np.concatenate(audio_data).astype(np.float32)
-
-    def _transcribe_audio(self, audio_data):
-        """Use Whisper API to transcribe audio"""
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-            write(tmpfile.name, self.sample_rate, audio_data)
-            
-            try:
-                with open(tmpfile.name, "rb") as audio_file:
-                    response = self.client.audio.transcriptions.create(
-                        model=self.model,
-                        file=audio_file,
-                        response_format="text"
-                    )
-                return response.strip()
-            except Exception as e:
-                logging.error(f"Whisper API error: {str(e)}")
-                return None
-            finally:
-                tmpfile.close()
-
-    def _parse_command(self, text):
-        """Enhanced command parsing with confidence scoring"""
-        if not text:
-            return None
-            
-        text = text.lower()
-        command_scores = {category: 0 for category in self.command_keywords}
-        
-        for category, keywords in self.command_keywords.items():
-            for keyword in keywords:
-                if keyword in text:
-                    command_scores[category] += 1
-        
-        # Threshold for valid command detection
-        if max(command_scores.values()) >= 1:
-            return [k for k, v in command_scores.items() if v > 0]
-        return None
-
-    def listen_for_command(self, timeout=5):
-        """Full voice command processing pipeline"""
-        try:
-            audio_data = self._record_audio(duration=timeout)
-            if audio_data is None:
-                return None
-                
-            transcription = self._transcribe_audio(audio_data)
-            if transcription:
-                print(f"Transcribed: {transcription}")
-            return self._parse_command(transcription)
-        except Exception as e:
-            logging.error(f"Voice processing failed: {str(e)}")
-            return None
+import voice_script
+from voice_script import VoiceCommandRecognizer
 
 class TestVoiceCommandRecognizer(unittest.TestCase):
     def setUp(self):
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.recognizer = VoiceCommandRecognizer(api_key=self.api_key)
+        # sounddevice is imported when recording starts; stand in for PortAudio
+        self.sounddevice = MagicMock()
+        patcher = patch.dict('sys.modules', {'sounddevice': self.sounddevice})
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_initialization(self):
         """Test if VoiceCommandRecognizer initializes properly"""
@@ -123,9 +27,9 @@ class TestVoiceCommandRecognizer(unittest.TestCase):
         self.assertEqual(self.recognizer.sample_rate, 16000)
         self.assertEqual(self.recognizer.channels, 1)
 
-    @patch('sounddevice.InputStream')
-    def test_record_audio(self, mock_input_stream):
+    def test_record_audio(self):
         """Test audio recording functionality"""
+        mock_input_stream = self.sounddevice.InputStream
         # Mock audio data
         mock_audio = np.random.rand(16000 * 5)  # 5 seconds of random audio
         
@@ -139,13 +43,64 @@ class TestVoiceCommandRecognizer(unittest.TestCase):
             self.assertIsNotNone(audio_data)
             self.assertEqual(len(audio_data), 16000 * 5)
 
+    def test_record_audio_buffer(self):
+        """Test callback blocks fill the preallocated buffer, skipping silence"""
+        mock_input_stream = self.sounddevice.InputStream
+        loud = np.full((1024, 1), 0.5, dtype=np.float32)
+        quiet = np.full((1024, 1), -0.01, dtype=np.float32)
+
+        def fake_stream(callback=None, **kwargs):
+            callback(quiet, 1024, None, None)
+            callback(-loud, 1024, None, None)  # Negative peaks count as loud too
+            for _ in range(15):  # 16384 frames overflows one second of audio
+                callback(loud, 1024, None, None)
+            return MagicMock()
+
+        mock_input_stream.side_effect = fake_stream
+        audio_data = self.recognizer._record_audio(duration=1)
+
+        self.assertEqual(audio_data.shape, (16000,))
+        self.assertEqual(audio_data.dtype, np.float32)
+        self.assertTrue(np.all(audio_data[:1024] == -0.5))
+        self.assertTrue(np.all(audio_data[1024:] == 0.5))
+        self.assertEqual(mock_input_stream.call_args[1]['latency'], 'low')
+        self.assertEqual(mock_input_stream.call_args[1]['blocksize'], 1024)
+
+    def test_record_audio_fractional_duration(self):
+        """Test a non-integer duration sizes the buffer to whole frames"""
+        loud = np.full((1024, 1), 0.5, dtype=np.float32)
+
+        def fake_stream(callback=None, **kwargs):
+            for _ in range(3):
+                callback(loud, 1024, None, None)
+            return MagicMock()
+
+        self.sounddevice.InputStream.side_effect = fake_stream
+        audio_data = self.recognizer._record_audio(duration=0.15)
+
+        self.assertEqual(audio_data.shape, (2400,))
+
+    def test_import_is_lazy(self):
+        """Test importing the module loads neither PortAudio nor the OpenAI SDK"""
+        code = "import sys, voice_script; print('sounddevice' in sys.modules, 'openai' in sys.modules)"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.stdout.split(), ['False', 'False'])
+
     def test_parse_command(self):
         """Test command parsing functionality"""
         # Test valid commands
-        text = "start production process"
+        text = "begin potion now"
         result = self.recognizer._parse_command(text)
-        self.assertIn('start', result)
-        self.assertIn('production', result)
+        self.assertIn('start_potion', result)
+
+        # Categories come back in keyword table order, matched case-insensitively
+        result = self.recognizer._parse_command("Finish potion, then START POTION")
+        self.assertEqual(result, ('start_potion', 'complete_potion'))
+
+        # Nested ingredient phrases report which ingredient was named
+        result = self.recognizer._parse_command("I added dragon blood")
+        self.assertEqual(result, ('add_ingredient', ('ingredient_type', 'dragon_blood')))
 
         # Test invalid command
         text = "random text without commands"
@@ -156,6 +111,23 @@ class TestVoiceCommandRecognizer(unittest.TestCase):
         result = self.recognizer._parse_command("")
         self.assertIsNone(result)
 
+    def test_keyword_table(self):
+        """Test nested ingredient phrases flatten into the keyword table"""
+        table = self.recognizer._kw_table
+        self.assertIn(('begin potion', 'start_potion'), table)
+        self.assertIn(('blood of dragon', ('ingredient_type', 'dragon_blood')), table)
+        # Ingredient names are categories, not phrases to match
+        self.assertNotIn('dragon_blood', [phrase for phrase, _ in table])
+
+    def test_parse_command_cached(self):
+        """Test a repeated transcript is only scanned once"""
+        first = self.recognizer._parse_command("Start potion")
+        second = self.recognizer._parse_command("start POTION")
+
+        self.assertIs(first, second)
+        info = self.recognizer._match_categories.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
     @patch('openai.Audio')
     def test_transcribe_audio(self, mock_audio):
         """Test audio transcription"""
@@ -168,15 +140,196 @@ class TestVoiceCommandRecognizer(unittest.TestCase):
             transcription = self.recognizer._transcribe_audio(mock_audio_data)
             self.assertEqual(transcription, "start production")
 
+    def test_transcribe_audio_in_memory(self):
+        """Test audio is uploaded as an in-memory 16-bit WAV"""
+        audio_data = np.random.uniform(-1, 1, 16000).astype(np.float32)
+
+        # Stand in for the lazily created OpenAI client
+        mock_client = self.recognizer.client = MagicMock()
+        mock_client.audio.transcriptions.create.return_value = " start production \n"
+        transcription = self.recognizer._transcribe_audio(audio_data)
+
+        self.assertEqual(transcription, "start production")
+        name, wav, mime = mock_client.audio.transcriptions.create.call_args[1]['file']
+        self.assertEqual((name, mime), ("audio.wav", "audio/wav"))
+        self.assertEqual(wav[:4], b'RIFF')
+        self.assertEqual(len(wav), 44 + 2 * 16000)
+
+        # The hand-written header describes the payload exactly
+        with wave.open(io.BytesIO(wav)) as reader:
+            self.assertEqual(reader.getnchannels(), 1)
+            self.assertEqual(reader.getsampwidth(), 2)
+            self.assertEqual(reader.getframerate(), 16000)
+            self.assertEqual(reader.getnframes(), 16000)
+
+    def test_transcribe_audio_clips_samples(self):
+        """Test samples outside [-1, 1] saturate instead of wrapping around"""
+        audio_data = np.array([1.5, -1.5, 0.5], dtype=np.float32)
+
+        mock_client = self.recognizer.client = MagicMock()
+        mock_client.audio.transcriptions.create.return_value = "start potion"
+        self.recognizer._transcribe_audio(audio_data)
+
+        wav = mock_client.audio.transcriptions.create.call_args[1]['file'][1]
+        pcm = np.frombuffer(wav[44:], dtype=np.int16)
+        self.assertEqual(pcm.tolist(), [32767, -32767, 16383])
+
+    def test_listen_skips_silence_and_short_audio(self):
+        """Test near-silent or very short recordings never reach Whisper"""
+        t = np.arange(16000, dtype=np.float32) / 16000
+        speech = 0.3 * np.sin(2 * np.pi * 220 * t)
+        cases = [
+            (speech * 0.01, None),  # RMS ~0.002
+            (speech[:3200], None),  # 0.2 s
+            (speech, ('start_potion',))
+        ]
+        for audio_data, expected in cases:
+            with patch.object(self.recognizer, '_record_audio', return_value=audio_data), \
+                    patch.object(self.recognizer, '_transcribe_audio',
+                                 return_value="start potion") as mock_transcribe:
+                self.assertEqual(self.recognizer.listen_for_command(), expected)
+            self.assertEqual(mock_transcribe.called, expected is not None)
+
     def test_command_keywords(self):
         """Test command keyword matching"""
         keywords = self.recognizer.command_keywords
         
         # Test each command category
-        self.assertIn('begin', keywords['start'])
-        self.assertIn('production', keywords['production'])
-        self.assertIn('consume', keywords['consume'])
-        self.assertIn('finish', keywords['finish'])
+        self.assertIn('begin potion', keywords['start_potion'])
+        self.assertIn('added', keywords['add_ingredient'])
+        self.assertIn('dragon blood', keywords['ingredient_type']['dragon_blood'])
+        self.assertIn('finish potion', keywords['complete_potion'])
+
+class TestRealtimeAudio(unittest.TestCase):
+    def test_realtime_audio_restores_state(self):
+        """Test GC and the scheduling policy are restored after recording"""
+        with patch('voice_script.os.sched_getscheduler', return_value=0), \
+                patch('voice_script.os.sched_getparam', return_value='param'), \
+                patch('voice_script.os.sched_setscheduler') as mock_set:
+            with voice_script._realtime_audio(pause_gc=True):
+                self.assertFalse(gc.isenabled())
+            self.assertTrue(gc.isenabled())
+
+        self.assertEqual(mock_set.call_args_list[0][0][1], os.SCHED_FIFO)
+        self.assertEqual(mock_set.call_args_list[-1][0], (0, 0, 'param'))
+
+    def test_realtime_audio_keeps_gc_by_default(self):
+        """Test the process-wide GC is left running unless asked to pause"""
+        with patch('voice_script.os.sched_setscheduler'):
+            with voice_script._realtime_audio():
+                self.assertTrue(gc.isenabled())
+
+    def test_realtime_audio_without_privileges(self):
+        """Test recording still works when realtime priority is refused"""
+        with patch('voice_script.os.sched_setscheduler', side_effect=PermissionError) as mock_set:
+            with voice_script._realtime_audio(pause_gc=True):
+                self.assertFalse(gc.isenabled())
+            self.assertTrue(gc.isenabled())
+        mock_set.assert_called_once()
+
+class TestFasterWhisperBackend(unittest.TestCase):
+    def setUp(self):
+        self.faster_whisper = MagicMock()
+        patcher = patch.dict('sys.modules', {'faster_whisper': self.faster_whisper})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.recognizer = voice_script.VoiceCommandRecognizer(api_key=None, backend="faster-whisper")
+        self.model = self.faster_whisper.WhisperModel.return_value
+
+    def test_local_model_initialization(self):
+        """Test local backend loads an int8 model and skips the API client"""
+        self.faster_whisper.WhisperModel.assert_called_once_with(
+            "tiny.en", device="cpu", compute_type="int8"
+        )
+        self.assertIsNone(self.recognizer.client)
+
+    def test_transcribe_local(self):
+        """Test float32 audio is passed straight to faster-whisper"""
+        audio_data = np.zeros(16000, dtype=np.float32)
+        self.model.transcribe.return_value = (
+            [MagicMock(text=" Start potion"), MagicMock(text=" now.")],
+            None
+        )
+
+        transcription = self.recognizer._transcribe_audio(audio_data)
+        self.assertEqual(transcription, "Start potion now.")
+        self.assertIs(self.model.transcribe.call_args[0][0], audio_data)
+
+    def test_transcription_cache(self):
+        """Test a repeated utterance skips the model and the cache stays bounded"""
+        self.recognizer._tx_cache_size = 2
+        self.model.transcribe.side_effect = lambda audio, **kwargs: (
+            [MagicMock(text=f"take {audio[0]:.1f}")], None
+        )
+        # Different envelopes: rising from 0.1, rising from 0.5, flat
+        first, second, third = (np.linspace(v, 0.9, 16000, dtype=np.float32) for v in (0.1, 0.5, 0.9))
+
+        self.assertEqual(self.recognizer._transcribe_audio(first), "take 0.1")
+        self.assertEqual(self.recognizer._transcribe_audio(first.copy()), "take 0.1")
+        self.assertEqual(self.model.transcribe.call_count, 1)
+
+        self.recognizer._transcribe_audio(second)
+        self.recognizer._transcribe_audio(third)
+        self.assertEqual(len(self.recognizer._tx_cache), 2)
+        self.recognizer._transcribe_audio(first)  # Evicted, so transcribed again
+        self.assertEqual(self.model.transcribe.call_count, 4)
+
+    def test_quiet_audio_is_not_cached(self):
+        """Test different low-energy recordings can't share a cache key"""
+        self.model.transcribe.side_effect = [([MagicMock(text="start potion")], None),
+                                             ([MagicMock(text="finish potion")], None)]
+        t = np.arange(16000, dtype=np.float32) / 16000
+        quiet_a = 0.02 * np.sin(2 * np.pi * 300 * t)
+        quiet_b = 0.02 * t * np.sin(2 * np.pi * 500 * t)
+
+        self.assertEqual(self.recognizer._transcribe_audio(quiet_a), "start potion")
+        self.assertEqual(self.recognizer._transcribe_audio(quiet_b), "finish potion")
+        self.assertFalse(self.recognizer._tx_cache)
+
+    def test_cache_tolerates_gain_and_shift(self):
+        """Test a louder, slightly shifted repeat still hits the cache"""
+        self.model.transcribe.return_value = ([MagicMock(text="start potion")], None)
+        t = np.arange(16000, dtype=np.float32) / 16000
+        utterance = 0.5 * np.sin(np.pi * t) ** 2 * np.sin(2 * np.pi * 220 * t)
+
+        self.recognizer._transcribe_audio(utterance)
+        self.recognizer._transcribe_audio(np.roll(utterance, 7) * 1.2)
+        self.model.transcribe.assert_called_once()
+
+    def test_cache_distinguishes_spectrum(self):
+        """Test utterances with the same rhythm but different sounds don't share a key"""
+        self.model.transcribe.side_effect = [([MagicMock(text="start potion")], None),
+                                             ([MagicMock(text="finish potion")], None)]
+        t = np.arange(16000, dtype=np.float32) / 16000
+        envelope = 0.5 * np.sin(np.pi * t) ** 2
+        voiced = envelope * np.sin(2 * np.pi * 220 * t)
+        fricative = envelope * np.sin(2 * np.pi * 4000 * t)
+
+        self.assertEqual(self.recognizer._transcribe_audio(voiced), "start potion")
+        self.assertEqual(self.recognizer._transcribe_audio(fricative), "finish potion")
+        self.assertEqual(self.model.transcribe.call_count, 2)
+
+    def test_transcription_cache_persists(self):
+        """Test cached transcripts are reloaded from SQLite"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_path = os.path.join(tmpdir, "transcripts.sqlite")
+            audio_data = np.full(16000, 0.5, dtype=np.float32)
+            self.model.transcribe.return_value = ([MagicMock(text="finish potion")], None)
+
+            recognizer = voice_script.VoiceCommandRecognizer(
+                api_key=None, backend="faster-whisper", cache_path=cache_path
+            )
+            recognizer._transcribe_audio(audio_data)
+            recognizer._cache_db.close()
+
+            restarted = voice_script.VoiceCommandRecognizer(
+                api_key=None, backend="faster-whisper", cache_path=cache_path
+            )
+            self.model.transcribe.reset_mock()
+            self.assertEqual(restarted._transcribe_audio(audio_data), "finish potion")
+            self.model.transcribe.assert_not_called()
+            restarted._cache_db.close()
 
 # Example usage
 if __name__ == "__main__":
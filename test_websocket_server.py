@@ -0,0 +1,128 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import patch
+from websocket_server import WebSocketManager, websocket_endpoint
+
+class FakeWebSocket:
+    """Minimal stand-in for a Starlette WebSocket"""
+    def __init__(self, delay=0, fail=False, incoming=()):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.closed_with = None
+        self.incoming = list(incoming) + [{'type': 'websocket.disconnect'}]
+
+    async def receive(self):
+        return self.incoming.pop(0)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.sent.append(json.loads(text))
+
+@pytest.mark.asyncio
+class TestWebSocketManager:
+    @pytest.fixture(autouse=True)
+    async def setup(self):
+        """Set up manager with connected clients"""
+        self.manager = WebSocketManager(queue_size=2)
+        self.fast = FakeWebSocket()
+        self.slow = FakeWebSocket(delay=60)
+        await self.manager.connect(self.fast)
+        await self.manager.connect(self.slow)
+
+        yield
+
+        for websocket in list(self.manager.active_connections):
+            self.manager.disconnect(websocket)
+
+    async def test_publish_delivers_to_clients(self):
+        """Test published data reaches connected clients"""
+        self.manager.publish({'type': 'sensor_reading', 'value': 25.5})
+        await asyncio.sleep(0.01)
+
+        assert self.fast.sent == [{'type': 'sensor_reading', 'value': 25.5}]
+
+    async def test_publish_drops_oldest_for_slow_client(self):
+        """Test a slow client's queue stays bounded and keeps newest data"""
+        self.manager.publish({'value': 0})
+        await asyncio.sleep(0.01)  # Slow writer is now blocked sending value 0
+        for value in range(1, 5):
+            self.manager.publish({'value': value})
+            await asyncio.sleep(0.01)
+
+        queue = self.manager._queues[self.slow]
+        assert queue.qsize() == 2
+        assert [json.loads(queue.get_nowait())['value'] for _ in range(2)] == [3, 4]
+        assert [m['value'] for m in self.fast.sent] == [0, 1, 2, 3, 4]
+
+    async def test_disconnect_stops_writer(self):
+        """Test disconnecting removes the client and its writer task"""
+        writer = self.manager._writers[self.fast]
+        self.manager.disconnect(self.fast)
+        await asyncio.sleep(0)
+
+        assert self.fast not in self.manager.active_connections
+        assert writer.cancelled()
+
+    async def test_broadcast_sends_concurrently(self):
+        """Test broadcast latency is the slowest send, not the sum"""
+        manager = WebSocketManager()
+        clients = [FakeWebSocket(delay=0.05) for _ in range(5)]
+        for client in clients:
+            await manager.connect(client)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await manager.broadcast({'value': 1})
+        assert loop.time() - start < 0.2
+        assert all(client.sent == [{'value': 1}] for client in clients)
+
+        for client in clients:
+            manager.disconnect(client)
+
+    async def test_broadcast_drops_failed_clients(self):
+        """Test a failing client is removed without affecting the others"""
+        manager = WebSocketManager()
+        good = FakeWebSocket()
+        bad = FakeWebSocket(fail=True)
+        await manager.connect(bad)
+        await manager.connect(good)
+
+        await manager.broadcast({'value': 1})
+        assert good.sent == [{'value': 1}]
+        assert manager.active_connections == {good}
+        assert bad not in manager._writers
+
+        manager.disconnect(bad)  # The endpoint's own cleanup stays safe
+        manager.disconnect(good)
+
+    async def test_shutdown_closes_clients(self):
+        """Test shutdown closes every client and clears the manager"""
+        await self.manager.shutdown()
+
+        assert self.fast.closed_with == 1001
+        assert self.slow.closed_with == 1001
+        assert not self.manager.active_connections
+        assert not self.manager._writers
+
+async def test_endpoint_ignores_client_messages():
+    """Test the endpoint only waits for disconnect and cleans up quietly"""
+    manager = WebSocketManager()
+    websocket = FakeWebSocket(incoming=[{'type': 'websocket.receive', 'text': 'ping'}])
+
+    with patch('websocket_server.manager', manager), \
+            patch('websocket_server.log.error') as mock_error:
+        await websocket_endpoint(websocket)
+
+    assert not websocket.incoming
+    assert not manager.active_connections
+    mock_error.assert_not_called()
@@ -0,0 +1,125 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import patch, AsyncMock
+from websocket_stream import RealTimeStream
+
+class FakeConnection:
+    """Minimal stand-in for a websockets client connection"""
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.frames = []
+        self.closed = False
+
+    async def send(self, message):
+        if self.fail:
+            raise ConnectionError("connection lost")
+        self.frames.append(json.loads(message))
+
+    async def close(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+class TestRealTimeStream:
+    @pytest.fixture(autouse=True)
+    async def setup(self):
+        """Set up stream with a patched websocket connection"""
+        self.connection = FakeConnection()
+        self.connect = AsyncMock(return_value=self.connection)
+        with patch('websocket_stream.websockets.connect', self.connect):
+            self.stream = RealTimeStream('ws://test', max_batch=3, max_age=0.05,
+                                         reconnect_delay=0.01)
+            yield
+            await self.stream.close()
+
+    async def test_send_data_does_not_wait_on_socket(self):
+        """Test send_data only queues the reading"""
+        assert self.stream.send_data({'value': 1}) is True
+        assert not self.connection.frames
+
+    async def test_flushes_full_batch_as_one_frame(self):
+        """Test a full batch goes out as a single frame"""
+        for value in range(3):
+            self.stream.send_data({'value': value})
+        await asyncio.sleep(0.01)
+
+        assert len(self.connection.frames) == 1
+        assert [m['data']['value'] for m in self.connection.frames[0]] == [0, 1, 2]
+        assert all(isinstance(m['timestamp'], int) for m in self.connection.frames[0])
+
+    async def test_sends_stragglers_once_stale(self):
+        """Test a partial batch is sent once it gets stale"""
+        self.stream.send_data({'value': 1})
+        await asyncio.sleep(0.15)
+
+        assert len(self.connection.frames) == 1
+        assert self.connection.frames[0][0]['data'] == {'value': 1}
+
+    async def test_reconnects_with_backoff(self):
+        """Test failed connects are retried and queued data survives"""
+        self.connect.side_effect = [OSError("refused"), OSError("refused"), self.connection]
+        self.stream.send_data({'value': 1})
+        await asyncio.sleep(0.2)
+
+        assert self.connect.await_count == 3
+        assert self.connection.frames[0][0]['data'] == {'value': 1}
+
+    async def test_resends_batch_after_send_failure(self):
+        """Test a batch that failed to send goes out on the next connection"""
+        broken = FakeConnection(fail=True)
+        self.connect.side_effect = [broken, self.connection]
+        self.stream.send_data({'value': 1})
+        await asyncio.sleep(0.15)
+
+        assert broken.closed
+        assert self.connection.frames == [[{'timestamp': self.connection.frames[0][0]['timestamp'],
+                                            'data': {'value': 1}}]]
+
+    async def test_close_sends_queued_data(self):
+        """Test close sends queued data before closing"""
+        self.stream.send_data({'value': 1})
+        await asyncio.sleep(0.01)
+        self.stream.send_data({'value': 2})
+        await self.stream.close()
+
+        assert [m['data']['value'] for frame in self.connection.frames for m in frame] == [1, 2]
+        assert self.connection.closed
+
+    async def test_close_while_batch_is_filling(self):
+        """Test close returns when data arrives as the batch wait is cancelled"""
+        self.stream.send_data({'value': 1})
+        await asyncio.sleep(0.01)
+        self.stream.send_data({'value': 2})
+        await asyncio.wait_for(self.stream.close(), 1)
+
+        assert [m['data']['value'] for frame in self.connection.frames for m in frame] == [1, 2]
+
+    async def test_unencodable_data_is_rejected(self):
+        """Test a reading orjson can't encode fails the caller, not the stream"""
+        with pytest.raises(TypeError):
+            self.stream.send_data({'value': object()})
+        self.stream.send_data({'value': 1})
+        await asyncio.sleep(0.15)
+
+        assert self.connection.frames[0][0]['data'] == {'value': 1}
+
+    async def test_backs_off_when_sends_keep_failing(self):
+        """Test a server that accepts connections but drops every send is retried with backoff"""
+        self.connect.return_value = FakeConnection(fail=True)
+        self.stream._reconnect_delay = 1.0
+        real_sleep = asyncio.sleep
+        delays = []
+
+        async def fake_sleep(delay):
+            delays.append(delay)
+            await real_sleep(0)
+
+        with patch('websocket_stream.asyncio.sleep', side_effect=fake_sleep):
+            self.stream.send_data({'value': 1})
+            for _ in range(100):
+                if len(delays) >= 3:
+                    break
+                await real_sleep(0.01)
+            await self.stream.close()
+
+        assert delays[:3] == [1.0, 2.0, 4.0]
@@ -1,27 +1,73 @@
 # Pro-Code Potions: Advanced audio processing
 # Thieving Bastards: OpenAI Whisper API integration
 
-from openai import OpenAI
 import logging
-import sounddevice as sd
 import numpy as np
-from scipy.io.wavfile import write
-import tempfile
+import struct
 import time
+import threading
+import re
+import functools
+import hashlib
+import sqlite3
+import gc
+import contextlib
+from collections import OrderedDict
 from dotenv import load_dotenv
 import os
-import openai
-from datetime import datetime
+
+log = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure OpenAI with API key from environment variable
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Band edges for the transcript cache's audio fingerprint: roughly voicing,
+# first formant, second formant and fricatives
+FINGERPRINT_BANDS_HZ = (300, 1000, 2500)
+
+# sounddevice (PortAudio) and openai are imported where they are first used,
+# so parsing, caching and the local backend work without them
+
+@contextlib.contextmanager
+def _realtime_audio(priority=10, pause_gc=False):
+    """Best-effort SCHED_FIFO, and optionally no GC pauses, while an audio stream runs"""
+    # Threads inherit the creator's policy, so PortAudio's callback thread,
+    # started inside this block, runs at realtime priority too
+    previous = None
+    try:
+        previous = (os.sched_getscheduler(0), os.sched_getparam(0))
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (AttributeError, OSError) as e:  # Not Linux, or no CAP_SYS_NICE/rtprio limit
+        log.debug("Realtime audio scheduling unavailable: %s", e)
+        previous = None
+    # gc.disable() is process-wide, so only pause it when nothing else shares the process
+    gc_enabled = gc.isenabled()
+    if pause_gc:
+        gc.disable()
+    try:
+        yield
+    finally:
+        if pause_gc and gc_enabled:
+            gc.enable()
+        if previous is not None:
+            try:
+                os.sched_setscheduler(0, *previous)
+            except OSError as e:
+                log.warning("Could not restore scheduling policy: %s", e)
 
 class VoiceCommandRecognizer:
-    def __init__(self, api_key, model="whisper-1"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, api_key, model="whisper-1", backend="openai", local_model="tiny.en",
+                 cache_path=None, cache_size=256, realtime=False):
+        self.backend = backend
+        # Pause the garbage collector while recording; for standalone use only,
+        # as it also stalls every other thread and event loop in the process
+        self.realtime = realtime
+        self._api_key = api_key
+        self._local_model = None
+        if backend == "faster-whisper":
+            # Local int8 CTranslate2 model: no WAV encode, upload or network round-trip
+            from faster_whisper import WhisperModel
+            self._local_model = WhisperModel(local_model, device="cpu", compute_type="int8")
         self.model = model
         self.command_keywords = {
             'start_potion': ['begin potion', 'start potion', 'create potion'],
@@ -37,75 +83,229 @@ class VoiceCommandRecognizer:
         self.sample_rate = 16000
         self.channels = 1
         self.silence_threshold = 0.03
+        # Recordings quieter or shorter than this are not worth a Whisper call
+        self.min_speech_rms = 0.005
+        self.min_speech_duration = 0.3  # Seconds
+        self._build_keyword_matcher()
+        # Recent transcripts keyed by audio fingerprint, optionally kept in SQLite
+        self._tx_cache = OrderedDict()
+        self._tx_cache_size = cache_size
+        self._cache_db = None
+        if cache_path:
+            self._open_cache(cache_path)
+
+    @functools.cached_property
+    def client(self):
+        """OpenAI client, created on the first API transcription"""
+        if self._local_model is not None:
+            return None
+        from openai import OpenAI
+        return OpenAI(api_key=self._api_key)
+
+    def _build_keyword_matcher(self):
+        """Compile all command keywords into one single-pass matcher"""
+        # One flat (phrase, category) table; nested phrases keep which entry
+        # matched, e.g. ('dragon blood', ('ingredient_type', 'dragon_blood'))
+        self._kw_table = []
+        for category, keywords in self.command_keywords.items():
+            if isinstance(keywords, dict):
+                for name, phrases in keywords.items():
+                    self._kw_table.extend((phrase, (category, name)) for phrase in phrases)
+            else:
+                self._kw_table.extend((phrase, category) for phrase in keywords)
+        self._keyword_category = dict(self._kw_table)
+        # Order results are reported in
+        self._categories = list(dict.fromkeys(category for _, category in self._kw_table))
+        # Longest first so a phrase wins over a keyword it contains; the
+        # lookahead lets matches overlap like the plain substring checks did
+        alternation = '|'.join(
+            re.escape(kw) for kw in sorted(self._keyword_category, key=len, reverse=True)
+        )
+        self._keyword_pattern = re.compile(f'(?=({alternation}))')
+        # Transcripts come from a small recurring vocabulary; memoize per matcher
+        self._match_categories = functools.lru_cache(maxsize=1024)(self._scan_categories)
 
     def _record_audio(self, duration=5):
         """Capture audio from microphone with voice activity detection"""
+        import sounddevice as sd
         print("Listening...")
-        audio_data = []
+        # Preallocated so the realtime callback only copies, never allocates
+        buffer = np.empty((int(self.sample_rate * duration), self.channels), dtype=np.float32)
+        blocksize = 1024
+        write_idx = 0
+        full = threading.Event()
         
         def callback(indata, frames, time, status):
+            nonlocal write_idx
             if status:
                 print(f"Error in audio stream: {status}")
-            if np.max(np.abs(indata)) > self.silence_threshold:
-                audio_data.extend(indata.copy())
+            # Two reductions give the peak magnitude without an np.abs temporary
+            peak = max(-indata.min(), indata.max())
+            if peak > self.silence_threshold:
+                n = min(frames, len(buffer) - write_idx)
+                buffer[write_idx:write_idx + n] = indata[:n]
+                write_idx += n
+                if write_idx == len(buffer):
+                    full.set()
         
-        with sd.InputStream(samplerate=self.sample_rate,
-                            channels=self.channels,
-                            callback=callback):
-            start_time = time.time()
-            while len(audio_data) < self.sample_rate * duration:
-                if time.time() - start_time > duration:
-                    break
-                sd.sleep(100)
+        with _realtime_audio(pause_gc=self.realtime), \
+                sd.InputStream(samplerate=self.sample_rate,
+                               channels=self.channels,
+                               dtype='float32',
+                               blocksize=blocksize,
+                               latency='low',
+                               callback=callback):
+            # PortAudio runs the callback on its own thread; block until the
+            # buffer fills or the time is up instead of polling
+            full.wait(duration)
         
-        if len(audio_data) == 0:
+        if write_idx == 0:
             print("No audio detected.")
             return None
             
-        return np.concatenate(audio_data).astype(np.float32)
+        return buffer[:write_idx].reshape(-1)
+
+    def _open_cache(self, cache_path):
+        """Load the most recent persisted transcripts into the LRU cache"""
+        # Listening runs on a worker thread, not the one that built the recognizer
+        self._cache_db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts (key TEXT PRIMARY KEY, text TEXT NOT NULL)"
+        )
+        rows = self._cache_db.execute(
+            "SELECT key, text FROM transcripts ORDER BY rowid DESC LIMIT ?",
+            (self._tx_cache_size,)
+        ).fetchall()
+        for key, text in reversed(rows):
+            self._tx_cache[key] = text
+
+    def _fingerprint(self, audio_data):
+        """Hash the 50 ms loudness and band-energy envelope; None if too quiet to tell apart"""
+        hop = self.sample_rate // 20
+        frames = len(audio_data) // hop
+        if frames == 0:
+            return None
+        framed = audio_data[:frames * hop].reshape(frames, hop)
+        rms = np.sqrt(np.mean(np.square(framed), axis=1))
+        peak = rms.max()
+        if peak < self.silence_threshold:
+            return None
+        # Normalizing to the peak makes the key gain-independent; coarse frames and
+        # 8 levels keep small shifts and noise from changing it
+        envelope = np.rint(rms * (7 / peak)).astype(np.uint8)
+
+        # Loudness alone can't tell apart words with the same rhythm ("start potion"
+        # vs "finish potion"), so also key on each frame's share of energy per band
+        power = np.square(np.abs(np.fft.rfft(framed, axis=1)))
+        edges = np.searchsorted(np.fft.rfftfreq(hop, 1 / self.sample_rate), FINGERPRINT_BANDS_HZ)
+        bands = np.add.reduceat(power, np.r_[0, edges], axis=1)
+        share = bands / np.maximum(bands.sum(axis=1, keepdims=True), 1e-12)
+        spectrum = np.rint(share * 3).astype(np.uint8)
+        spectrum[rms < self.silence_threshold] = 0  # Quiet frames' spectra are just noise
+
+        digest = hashlib.blake2b(envelope.tobytes(), digest_size=8)
+        digest.update(spectrum.tobytes())
+        digest.update(frames.to_bytes(4, 'little'))
+        return digest.hexdigest()
+
+    def _cache_transcript(self, key, text):
+        """Store a transcript, evicting the least recently used entry"""
+        self._tx_cache[key] = text
+        self._tx_cache.move_to_end(key)
+        if len(self._tx_cache) > self._tx_cache_size:
+            self._tx_cache.popitem(last=False)
+        if self._cache_db is not None:
+            with self._cache_db:
+                self._cache_db.execute(
+                    "INSERT OR REPLACE INTO transcripts (key, text) VALUES (?, ?)", (key, text)
+                )
+                self._cache_db.execute(
+                    "DELETE FROM transcripts WHERE rowid NOT IN "
+                    "(SELECT rowid FROM transcripts ORDER BY rowid DESC LIMIT ?)",
+                    (self._tx_cache_size,)
+                )
 
     def _transcribe_audio(self, audio_data):
+        """Transcribe audio, reusing the transcript of a repeated utterance"""
+        key = self._fingerprint(audio_data)
+        text = self._tx_cache.get(key) if key else None
+        if text is not None:
+            self._tx_cache.move_to_end(key)
+            return text
+
+        if self._local_model is not None:
+            text = self._transcribe_local(audio_data)
+        else:
+            text = self._transcribe_api(audio_data)
+        if text and key:
+            self._cache_transcript(key, text)
+        return text
+
+    def _wav_header(self, nbytes):
+        """44-byte RIFF header for nbytes of 16-bit PCM at the recording format"""
+        block_align = self.channels * 2
+        return struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + nbytes, b'WAVE',
+            b'fmt ', 16, 1, self.channels, self.sample_rate,
+            self.sample_rate * block_align, block_align, 16,
+            b'data', nbytes
+        )
+
+    def _transcribe_api(self, audio_data):
         """Use Whisper API to transcribe audio"""
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-            write(tmpfile.name, self.sample_rate, audio_data)
-            
-            try:
-                with open(tmpfile.name, "rb") as audio_file:
-                    response = self.client.audio.transcriptions.create(
-                        model=self.model,
-                        file=audio_file,
-                        response_format="text"
-                    )
-                return response.strip()
-            except Exception as e:
-                logging.error(f"Whisper API error: {str(e)}")
-                return None
-            finally:
-                tmpfile.close()
+        # Encode a 16-bit PCM WAV in memory instead of a temp file round-trip.
+        # Clip first: out-of-range samples would wrap around in the int16 cast
+        pcm = (np.clip(audio_data, -1, 1) * 32767).astype('<i2').tobytes()
+        
+        try:
+            response = self.client.audio.transcriptions.create(
+                model=self.model,
+                file=("audio.wav", self._wav_header(len(pcm)) + pcm, "audio/wav"),
+                response_format="text"
+            )
+            return response.strip()
+        except Exception as e:
+            log.error("Whisper API error: %s", e)
+            return None
+
+    def _transcribe_local(self, audio_data):
+        """Transcribe float32 audio with the local faster-whisper model"""
+        try:
+            segments, _ = self._local_model.transcribe(
+                audio_data,
+                language="en",
+                vad_filter=True,
+                beam_size=1
+            )
+            return "".join(segment.text for segment in segments).strip()
+        except Exception as e:
+            log.error("faster-whisper error: %s", e)
+            return None
 
     def _parse_command(self, text):
-        """Enhanced command parsing with confidence scoring"""
+        """Detect command categories, memoized on the lowercased transcript"""
         if not text:
             return None
-            
-        text = text.lower()
-        command_scores = {category: 0 for category in self.command_keywords}
-        
-        for category, keywords in self.command_keywords.items():
-            for keyword in keywords:
-                if keyword in text:
-                    command_scores[category] += 1
-        
-        # Threshold for valid command detection
-        if max(command_scores.values()) >= 1:
-            return [k for k, v in command_scores.items() if v > 0]
-        return None
+        return self._match_categories(text.lower())
+
+    def _scan_categories(self, text):
+        """Match all keywords in one pass; a tuple so cached results can be shared"""
+        hits = {self._keyword_category[m.group(1)] for m in self._keyword_pattern.finditer(text)}
+        # Report categories in command_keywords order
+        return tuple(category for category in self._categories if category in hits) or None
+
+    def _has_speech(self, audio_data):
+        """Check the recording is long and loud enough to transcribe"""
+        if len(audio_data) < self.min_speech_duration * self.sample_rate:
+            return False
+        return float(np.sqrt(np.mean(np.square(audio_data)))) >= self.min_speech_rms
 
     def listen_for_command(self, timeout=5):
         """Full voice command processing pipeline"""
         try:
             audio_data = self._record_audio(duration=timeout)
-            if audio_data is None:
+            if audio_data is None or not self._has_speech(audio_data):
                 return None
                 
             transcription = self._transcribe_audio(audio_data)
@@ -113,7 +313,7 @@ class VoiceCommandRecognizer:
                 print(f"Transcribed: {transcription}")
             return self._parse_command(transcription)
         except Exception as e:
-            logging.error(f"Voice processing failed: {str(e)}")
+            log.error("Voice processing failed: %s", e)
             return None
 
 class PotionMixer:
@@ -127,8 +327,9 @@ class PotionMixer:
         
     async def start_new_potion(self):
         """Initialize a new potion brewing session"""
+        # Timestamps are integer nanoseconds since the epoch (time.time_ns())
         self.current_potion = {
-            'start_time': datetime.now().isoformat(),
+            'start_time': time.time_ns(),
             'ingredients': [],
             'total_volume': 0
         }
@@ -150,7 +351,7 @@ class PotionMixer:
         ingredient = {
             'type': ingredient_type,
             'volume': volume_added,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': time.time_ns()
         }
         
         self.current_potion['ingredients'].append(ingredient)
@@ -175,7 +376,8 @@ class PotionMixer:
 
 # Example usage
 if __name__ == "__main__":
-    recognizer = VoiceCommandRecognizer(api_key=openai.api_key)
+    recognizer = VoiceCommandRecognizer(api_key=os.getenv('OPENAI_API_KEY'), realtime=True)
+    gc.freeze()  # Long-lived setup objects stay out of later collections
     while True:
         command = recognizer.listen_for_command()
         if command:
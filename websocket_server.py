@@ -1,10 +1,18 @@
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
-import json
+from contextlib import asynccontextmanager
 import logging
+import orjson
 
-app = FastAPI()
+log = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await manager.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -16,22 +24,73 @@ app.add_middleware(
 )
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections = []
+    def __init__(self, queue_size=16):
+        self.active_connections = set()
+        self.queue_size = queue_size  # Per-client outbound backlog before dropping
+        self._queues = {}
+        self._writers = {}
         
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues[websocket] = queue
+        self._writers[websocket] = asyncio.create_task(self._writer(websocket, queue))
         
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        # A failed broadcast may already have dropped this client
+        self.active_connections.discard(websocket)
+        self._queues.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer is not None:
+            writer.cancel()
         
+    async def shutdown(self):
+        """Close every client so their endpoint handlers return"""
+        connections = list(self.active_connections)
+        await asyncio.gather(
+            *(connection.close(code=1001) for connection in connections),
+            return_exceptions=True
+        )
+        for connection in connections:
+            self.disconnect(connection)
+
     async def broadcast(self, data: dict):
-        for connection in self.active_connections:
+        """Send data to every client concurrently, dropping clients that fail"""
+        payload = orjson.dumps(data).decode()  # Encode once for all clients
+        # Snapshot: clients may connect or disconnect while sends are pending
+        connections = list(self.active_connections)
+        dead = set()
+        await asyncio.gather(
+            *(self._send(connection, payload, dead) for connection in connections),
+            return_exceptions=True
+        )
+        for connection in dead:
+            self.disconnect(connection)
+
+    async def _send(self, websocket: WebSocket, payload: str, dead: set):
+        try:
+            await websocket.send_text(payload)
+        except Exception as e:
+            log.error("Error broadcasting: %s", e)
+            dead.add(websocket)
+
+    def publish(self, data: dict):
+        """Queue data for every client without waiting on any socket"""
+        payload = orjson.dumps(data).decode()  # Encode once for all clients
+        for queue in self._queues.values():
+            if queue.full():
+                queue.get_nowait()  # Slow client: drop its oldest message
+            queue.put_nowait(payload)
+
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        """Drain one client's queue so a slow socket only delays itself"""
+        while True:
+            payload = await queue.get()
             try:
-                await connection.send_json(data)
+                await websocket.send_text(payload)
             except Exception as e:
-                logging.error(f"Error broadcasting: {str(e)}")
+                log.error("Error broadcasting: %s", e)
                 
 manager = WebSocketManager()
 
@@ -39,12 +98,25 @@ manager = WebSocketManager()
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
-        while True:
-            # Keep connection alive
-            await websocket.receive_text()
+        # Clients only listen: wait for the disconnect and ignore anything they send.
+        # Dead peers are detected by the server's protocol-level pings, not client traffic.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
     except Exception as e:
-        logging.error(f"WebSocket error: {str(e)}")
+        log.error("WebSocket error: %s", e)
     finally:
         manager.disconnect(websocket)
 
-# Run with: uvicorn websocket_server:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+if __name__ == "__main__":
+    import uvicorn
+    # uvloop and httptools are the C-backed loop and HTTP parser (uvicorn[standard])
+    uvicorn.run(
+        "websocket_server:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        ws_ping_interval=20,
+        ws_ping_timeout=20
+    )
@@ -1,44 +1,118 @@
 import asyncio
 import websockets
-import json
 import logging
-from datetime import datetime
+import time
+import orjson
+
+log = logging.getLogger(__name__)
 
 class RealTimeStream:
-    def __init__(self, websocket_url):
+    def __init__(self, websocket_url, max_batch=200, max_age=0.25,
+                 queue_size=10_000, reconnect_delay=1.0):
         self.websocket_url = websocket_url
         self.websocket = None
         self.connected = False
+        # Producers only enqueue; a background task owns the socket, batching
+        # readings into one frame once the batch is full or stale
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._pending = []  # Batch being sent, kept for retry after a reconnect
+        self._max_batch = max_batch
+        self._max_age = max_age
+        self._reconnect_delay = reconnect_delay
+        self._stop = asyncio.Event()
+        self._task = None
         
     async def connect(self):
         """Establish WebSocket connection"""
         try:
             self.websocket = await websockets.connect(self.websocket_url)
             self.connected = True
-            logging.info("WebSocket connection established")
+            log.info("WebSocket connection established")
         except Exception as e:
-            logging.error(f"WebSocket connection failed: {str(e)}")
+            log.error("WebSocket connection failed: %s", e)
             self.connected = False
             
-    async def send_data(self, data):
-        """Send data through WebSocket"""
-        if not self.connected:
+    def send_data(self, data):
+        """Encode and queue data for sending without waiting on the socket"""
+        # Encoding here means a reading orjson can't serialize fails its caller
+        # instead of poisoning a batch. Timestamps are integer nanoseconds since the epoch.
+        message = orjson.dumps({
+            'timestamp': time.time_ns(),
+            'data': data
+        })
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if self._queue.full():
+            self._queue.get_nowait()  # Link down too long: drop the oldest reading
+        self._queue.put_nowait(message)
+        return True
+
+    async def _run(self):
+        """Keep the connection up and drain the queue in batches"""
+        delay = self._reconnect_delay
+        # Loops check the stop flag as well as honouring cancel(): wait_for can
+        # swallow a cancellation that races with a queue item arriving
+        while not self._stop.is_set():
             await self.connect()
-            
+            if self.connected:
+                try:
+                    while not self._stop.is_set():
+                        await self._next_batch()
+                        await self._send_pending()
+                        # Only a delivered batch proves the link works again
+                        delay = self._reconnect_delay
+                except Exception as e:
+                    log.error("Error sending data: %s", e)
+                    self.connected = False
+                    await self._close_socket()
+            if not self._stop.is_set():
+                # Back off after a failed connect or a failed send alike
+                await asyncio.sleep(delay)
+                delay = min(30.0, delay * 2)
+
+    async def _next_batch(self):
+        """Fill the pending batch until it is full or its oldest reading is stale"""
+        if not self._pending:
+            self._pending.append(await self._queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_age
+        while len(self._pending) < self._max_batch:
+            try:
+                self._pending.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+    async def _send_pending(self):
+        """Send the pending batch as one JSON array frame"""
+        await self.websocket.send((b'[' + b','.join(self._pending) + b']').decode())
+        self._pending = []
+
+    async def _close_socket(self):
         try:
-            message = {
-                'timestamp': datetime.now().isoformat(),
-                'data': data
-            }
-            await self.websocket.send(json.dumps(message))
-            return True
-        except Exception as e:
-            logging.error(f"Error sending data: {str(e)}")
-            self.connected = False
-            return False
+            await self.websocket.close()
+        except Exception:
+            pass
             
     async def close(self):
-        """Close WebSocket connection"""
+        """Send queued data if still connected and close WebSocket connection"""
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while not self._queue.empty():
+            self._pending.append(self._queue.get_nowait())
+        if self.connected and self._pending:
+            try:
+                await self._send_pending()
+            except Exception as e:
+                log.error("Error sending data: %s", e)
         if self.websocket:
             await self.websocket.close()
-            self.connected = False 
\ No newline at end of file
+            self.connected = False